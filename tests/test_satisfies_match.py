@@ -13,7 +13,7 @@
 # limitations under the License.
 
 import unittest
-from ofequivalence.rule import Match
+from ofequivalence.rule import Match, ActionList, Instructions
 import ttp_tools.ttp_satisfies
 from ttp_tools import TTP
 
@@ -316,3 +316,171 @@ class TestTTPMatches(unittest.TestCase):
             ([ipv4_src, vlan],                      False),  # 2
             ]
         self.check_cases(simple_match, cases)
+
+
+def make_instructions(apply_=(), write=(), goto_table=None,
+                      clear_actions=None):
+    """ Builds Instructions from lists of (action, value) tuples """
+    instructions = Instructions()
+    for action in apply_:
+        instructions.apply_actions.append(*action)
+    for action in write:
+        instructions.write_actions.append(*action)
+    if goto_table is not None:
+        instructions.goto_table = goto_table
+    if clear_actions is not None:
+        instructions.clear_actions = clear_actions
+    return instructions
+
+
+def make_actions(actions):
+    """ Builds an ActionList from a list of (action, value) tuples """
+    action_list = ActionList()
+    for action in actions:
+        action_list.append(*action)
+    return action_list
+
+
+OUTPUT = ("OUTPUT", 1)
+POP_VLAN = ("POP_VLAN", None)
+SET_VLAN = ("SET_FIELD", ("VLAN_VID", 0x1005))
+
+
+class TestTTPOpcodeMasks(unittest.TestCase):
+    """ Tests the opcode masks used to reject instructions and actions
+        before trying to place them
+    """
+
+    def setUp(self):
+        self.ttp = TTP.TableTypePattern(
+            './tests/test_patterns/satisfies_instructions.json')
+
+    def find_flow(self, name):
+        return self.ttp.find_table("First Table").find_flow_mod(name)
+
+    def test_required_action(self):
+        """ An apply or write requiring OUTPUT rejects instructions without
+            one, including empty instructions
+        """
+        instruction_set = self.find_flow("Test Required Output").instruction_set
+        self.assertTrue(instruction_set.satisfies(
+            make_instructions(apply_=[OUTPUT])))
+        self.assertFalse(instruction_set.satisfies(
+            make_instructions(apply_=[POP_VLAN])))
+        self.assertFalse(instruction_set.satisfies(make_instructions()))
+        self.assertFalse(instruction_set._satisfies(
+            make_instructions(apply_=[POP_VLAN]), {Instructions()},
+            final=False))
+
+        instruction_set = self.find_flow("Test Optional Pop VLAN").instruction_set
+        self.assertTrue(instruction_set.satisfies(
+            make_instructions(write=[POP_VLAN, OUTPUT])))
+        self.assertTrue(instruction_set.satisfies(
+            make_instructions(write=[OUTPUT])))
+        self.assertFalse(instruction_set.satisfies(
+            make_instructions(write=[POP_VLAN])))
+
+    def test_unplaceable_only_when_final(self):
+        """ Instructions and actions which no item can place are only
+            rejected when final, otherwise they are left remaining
+        """
+        instruction_set = self.find_flow("Test Required Output").instruction_set
+        instructions = make_instructions(apply_=[OUTPUT], goto_table=1)
+        self.assertFalse(instruction_set._satisfies(
+            instructions, {Instructions()}, final=True))
+        remaining = instruction_set._satisfies(
+            instructions, {Instructions()}, final=False)
+        self.assertEqual([x.goto_table for x in remaining], [1])
+
+        instruction_set = self.find_flow("Test Goto or Clear").instruction_set
+        instructions = make_instructions(apply_=[OUTPUT])
+        self.assertFalse(instruction_set.satisfies(instructions))
+        self.assertTrue(instruction_set._satisfies(
+            instructions, {Instructions()}, final=False))
+
+        actions = self.find_flow("Test Required Output").instruction_set[0].actions
+        self.assertFalse(actions._satisfies(
+            make_actions([POP_VLAN, OUTPUT]), {ActionList()}, final=True))
+        remaining = actions._satisfies(
+            make_actions([POP_VLAN, OUTPUT]), {ActionList()}, final=False)
+        self.assertEqual(list(remaining), [make_actions([POP_VLAN])])
+
+    def test_never_required(self):
+        """ GOTO_TABLE and CLEAR_ACTIONS are placed whether or not they are
+            in the input, so are never required
+        """
+        instruction_set = self.find_flow("Test Goto or Clear").instruction_set
+        self.assertTrue(instruction_set.satisfies(make_instructions()))
+        self.assertTrue(instruction_set.satisfies(
+            make_instructions(goto_table=1)))
+        self.assertTrue(instruction_set.satisfies(
+            make_instructions(clear_actions=True)))
+        self.assertTrue(instruction_set.satisfies(
+            make_instructions(goto_table=1, clear_actions=True)))
+
+    def test_group(self):
+        """ A GROUP places the actions of its buckets, so must not reject
+            actions which are not GROUPs
+        """
+        instruction_set = self.find_flow("Test Group").instruction_set
+        self.assertTrue(instruction_set.satisfies(
+            make_instructions(apply_=[OUTPUT])))
+        actions = instruction_set[0].actions
+        self.assertTrue(actions._satisfies(
+            make_actions([OUTPUT]), {ActionList()}, final=True))
+        self.assertFalse(actions._satisfies(
+            make_actions([POP_VLAN, OUTPUT]), {ActionList()}, final=True))
+
+    def test_allow_vlan_translation(self):
+        """ $ALLOW_VLAN_TRANSLATION places nothing, so it neither requires
+            nor allows a SET_FIELD
+        """
+        instruction_set = self.find_flow("Test VLAN Translation").instruction_set
+        self.assertTrue(instruction_set.satisfies(
+            make_instructions(apply_=[OUTPUT])))
+        self.assertFalse(instruction_set.satisfies(
+            make_instructions(apply_=[SET_VLAN, OUTPUT])))
+        actions = instruction_set[0].actions
+        self.assertTrue(actions._satisfies(
+            make_actions([OUTPUT]), {ActionList()}, final=True))
+
+    def test_masks_do_not_change_results(self):
+        """ The results are the same as with the opcode masks disabled """
+        candidates = [
+            make_instructions(),
+            make_instructions(apply_=[OUTPUT]),
+            make_instructions(apply_=[POP_VLAN, OUTPUT]),
+            make_instructions(apply_=[SET_VLAN, OUTPUT]),
+            make_instructions(apply_=[POP_VLAN]),
+            make_instructions(write=[OUTPUT]),
+            make_instructions(write=[POP_VLAN, OUTPUT]),
+            make_instructions(apply_=[POP_VLAN], write=[OUTPUT]),
+            make_instructions(goto_table=1),
+            make_instructions(apply_=[OUTPUT], goto_table=1),
+            make_instructions(clear_actions=True),
+            make_instructions(write=[OUTPUT], clear_actions=True),
+            ]
+        for path in ('0-simple_working_example-utf8.json',
+                     '4-extra-flowtable.json',
+                     'satisfies_match.json',
+                     'satisfies_instructions.json'):
+            ttp = TTP.TableTypePattern('./tests/test_patterns/' + path)
+            instruction_sets = list(ttp.collect_children(TTP.TTPInstructionSet))
+            self.assertTrue(instruction_sets)
+            results = [[instruction_set._satisfies(x, {Instructions()}, final)
+                        for x in candidates for final in (True, False)]
+                       for instruction_set in instruction_sets]
+
+            # Disable the masks, so that nothing is rejected early
+            lists = list(ttp.collect_children(TTP.TTPActionList))
+            for group in ttp.get_groups():
+                lists += group.collect_children(TTP.TTPActionList)
+            for ttp_list in lists + instruction_sets:
+                ttp_list.required_op_mask = 0
+                ttp_list.allowed_op_mask = -1
+
+            for instruction_set, expected in zip(instruction_sets, results):
+                self.assertEqual(
+                    [instruction_set._satisfies(x, {Instructions()}, final)
+                     for x in candidates for final in (True, False)],
+                    expected, path + ": " + str(instruction_set))
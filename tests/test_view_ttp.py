@@ -0,0 +1,104 @@
+# Copyright 2019 Richard Sanger, Wand Network Research Group
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import io
+import sys
+import unittest
+from six import StringIO
+from ttp_tools.view_ttp import parse_args, HELP, USAGE
+
+
+class TestParseArgs(unittest.TestCase):
+
+    def setUp(self):
+        self.stdout = sys.stdout
+        self.stderr = sys.stderr
+        sys.stdout = StringIO()
+        sys.stderr = StringIO()
+
+    def tearDown(self):
+        sys.stdout = self.stdout
+        sys.stderr = self.stderr
+
+    def check_exit(self, argv, code):
+        """ Checks parse_args exits with code, returns the output """
+        sys.stdout = StringIO()
+        sys.stderr = StringIO()
+        with self.assertRaises(SystemExit) as cm:
+            parse_args(argv)
+        self.assertEqual(cm.exception.code, code)
+        return sys.stdout.getvalue(), sys.stderr.getvalue()
+
+    def check_error(self, argv, message):
+        """ Checks parse_args exits with the usage and error message """
+        out, err = self.check_exit(argv, 2)
+        self.assertEqual(out, "")
+        self.assertEqual(err, USAGE + "\nview_ttp: error: " + message + "\n")
+
+    def test_ttp(self):
+        self.assertEqual(parse_args(['a.json']), ('a.json', False, None))
+        self.assertEqual(parse_args(['-']), ('-', False, None))
+
+    def test_quiet(self):
+        self.assertEqual(parse_args(['-q', 'a.json']), ('a.json', True, None))
+        self.assertEqual(parse_args(['a.json', '--quiet']),
+                         ('a.json', True, None))
+
+    def test_dump(self):
+        self.assertEqual(parse_args(['a.json', '--dump', 'tables']),
+                         ('a.json', False, 'tables'))
+        self.assertEqual(parse_args(['--dump=groups', '-q', 'a.json']),
+                         ('a.json', True, 'groups'))
+        # The last --dump given wins
+        self.assertEqual(parse_args(['--dump', 'info', 'a.json',
+                                     '--dump=security']),
+                         ('a.json', False, 'security'))
+
+    def test_positional_only(self):
+        self.assertEqual(parse_args(['--', '-q']), ('-q', False, None))
+        self.assertEqual(parse_args(['-q', '--', '--dump']),
+                         ('--dump', True, None))
+
+    def test_help(self):
+        for arg in ('-h', '--help'):
+            out, err = self.check_exit(['a.json', arg], 0)
+            self.assertEqual(out, HELP + "\n")
+            self.assertEqual(err, "")
+
+    def test_errors(self):
+        self.check_error([], "the following arguments are required: ttp")
+        self.check_error(['-q'], "the following arguments are required: ttp")
+
+    def test_unrecognized(self):
+        self.check_error(['a.json', 'b.json'],
+                         "unrecognized arguments: b.json")
+        self.check_error(['a.json', '-x'], "unrecognized arguments: -x")
+
+    def test_dump_errors(self):
+        self.check_error(['a.json', '--dump'],
+                         "argument --dump: expected one argument")
+        self.check_error(['a.json', '--dump=all'],
+                         "argument --dump: invalid choice: 'all' (choose from"
+                         " 'info', 'security', 'tables', 'groups',"
+                         " 'identifiers')")
+
+    def test_readme_help(self):
+        """ The README should include the current help text """
+        with io.open('./README.md', encoding='utf-8') as f:
+            readme = f.read()
+        self.assertIn("$ view_ttp -h\n" + HELP + "\n```", readme)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -45,6 +45,7 @@ any of the existing subclasses.
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+from __future__ import print_function
 import json
 import io
 import logging
@@ -941,7 +942,12 @@ class TTPFlow(TTPObject):
         self.instruction_set = TTPInstructionSet(input_["instruction_set"],
                                                  self)
 
-    def print_flow(self, nesting=None):
+    def print_flow(self, nesting=None, file=None):
+        """ Prints a description of this flow
+
+            nesting: A prefix for each line, such as a tab
+            file: The file to print to, defaults to stdout
+        """
         n = ''
         if nesting is not None:
             n = nesting
@@ -952,15 +958,16 @@ class TTPFlow(TTPObject):
                        'priority=' + str(self.priority) + ' ' +
                        str(self.match_set) + ' ' +
                        str(self.instruction_set)
-                       .replace("\n", ",").replace("\t", "")))
+                       .replace("\n", ",").replace("\t", "")), file=file)
             return
-        print(n + self.name)
+        print(n + self.name, file=file)
         if self.doc:
-            print(nn + "Doc: " + str(self.doc))
-        print(nn + "Priority: " + str(self.priority))
-        print(nn + "Matches: " + str(self.match_set))
-        print(nn + "Instructions:")
-        print(nnn + str(self.instruction_set).replace('\n', '\n' + nnn))
+            print(nn + "Doc: " + str(self.doc), file=file)
+        print(nn + "Priority: " + str(self.priority), file=file)
+        print(nn + "Matches: " + str(self.match_set), file=file)
+        print(nn + "Instructions:", file=file)
+        print(nnn + str(self.instruction_set).replace('\n', '\n' + nnn),
+              file=file)
 
     def __str__(self):
         if self.built_in:
@@ -1411,42 +1418,33 @@ class TableTypePattern(TTPObject):
         else:
             self.path = path
             self.log.info("Loading TTP from the file %s", self.path)
-        if track_orig:
-            if as_unicode:
+        if as_unicode:
+            if track_orig:
                 tmp = _load_tracked_json(path, as_unicode)
             else:
-                _e = None
-                for enc in ['utf-8', 'utf-16', 'utf-32']:
-                    try:
-                        with io.open(self.path, encoding=enc) as data_file:
-                            tmp = _load_tracked_json(data_file, as_unicode)
-                    except Exception as e:
-                        if _e is None:
-                            _e = e
-                        continue
-                    else:
-                        break
-                else:  # Finished loop without breaking, i.e. error
-                    self.log.critical("Unable to open JSON file")
-                    raise _e
-        else:
-            if as_unicode:
                 tmp = json.loads(path)
-            else:
-                _e = None
-                for enc in ['utf-8', 'utf-16', 'utf-32']:
-                    try:
-                        with io.open(self.path, encoding=enc) as data_file:
-                            tmp = json.load(data_file)
-                    except Exception as e:
-                        if _e is None:
-                            _e = e
-                        continue
-                    else:
-                        break
-                else:  # Finished loop without breaking, i.e. error
-                    self.log.critical("Unable to open JSON file")
-                    raise _e
+        else:
+            load = _load_tracked_json if track_orig else json.load
+            try:
+                # Read the file once and decode each encoding from memory
+                with io.open(self.path, 'rb') as data_file:
+                    raw = data_file.read()
+            except Exception:
+                self.log.critical("Unable to open JSON file")
+                raise
+            _e = None
+            for enc in ['utf-8', 'utf-16', 'utf-32']:
+                try:
+                    tmp = load(io.TextIOWrapper(io.BytesIO(raw), encoding=enc))
+                except Exception as e:
+                    if _e is None:
+                        _e = e
+                    continue
+                else:
+                    break
+            else:  # Finished loop without breaking, i.e. error
+                self.log.critical("Unable to open JSON file")
+                raise _e
         self.allow_unsafe = allow_unsafe
         TTPObject.__init__(self, input_=tmp, parent=None)
         # Load a copy of the oxm of_13_fields
@@ -1614,15 +1612,20 @@ class TableTypePattern(TTPObject):
             return self.groups_by_name[group[1:-1]]
         return self.groups_by_name[group]
 
-    def print_table(self, name):
+    def print_table(self, name, file=None):
+        """ Prints the flows of a table
+
+            name: The table, see find_table
+            file: The file to print to, defaults to stdout
+        """
         table = self.find_table(name)
-        print("Displaying flows for the " + table.name + " table:")
+        print("Displaying flows for the " + table.name + " table:", file=file)
         for flow in table.flow_mod_types:
-            flow.print_flow(nesting='\t')
+            flow.print_flow(nesting='\t', file=file)
         if table.built_in_flow_mods:
-            print("\tBuilt in Rules:")
+            print("\tBuilt in Rules:", file=file)
             for bifm in table.built_in_flow_mods:
-                bifm.print_flow(nesting='\t\t')
+                bifm.print_flow(nesting='\t\t', file=file)
 
     def name2id(self, name):
         return self.tables_by_name[name].number
@@ -36,85 +36,132 @@ from ttp_utils.TTP import TableTypePattern
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import os
 from collections import defaultdict
-import operator
 
 from six import integer_types, viewitems, viewvalues
-from six.moves import reduce
 from ofequivalence.rule import Rule, ActionList, Group, Match, Bucket, Instructions
 
 from . import TTP
 from .ttp_util import extend_class, subclass, expect_list
 
-lor = operator.or_
-land = operator.and_
-
-
-class Remaining(object):
-    """ A class to collect all variations of a result """
-    __slots__ = ("data",)
+# Set TTP_DEEP_CHECK in the environment to verify the type of every rule
+# returned by TTPFlow._satisfies, this walks the full result each call
+_TTP_DEEP_CHECK = bool(os.environ.get("TTP_DEEP_CHECK"))
+
+# Maps an instruction or action type to its bit within an opcode mask.
+# The OpenFlow 1.3 types are interned in spec order, extensions are
+# assigned the next free bit when first seen.
+_OPCODE_BITS = {op: 1 << i for i, op in enumerate((
+    # Instructions
+    "GOTO_TABLE", "WRITE_METADATA", "WRITE_ACTIONS", "APPLY_ACTIONS",
+    "CLEAR_ACTIONS", "METER",
+    # Actions
+    "OUTPUT", "COPY_TTL_OUT", "COPY_TTL_IN", "SET_MPLS_TTL", "DEC_MPLS_TTL",
+    "PUSH_VLAN", "POP_VLAN", "PUSH_MPLS", "POP_MPLS", "SET_QUEUE", "GROUP",
+    "SET_NW_TTL", "DEC_NW_TTL", "SET_FIELD", "PUSH_PBB", "POP_PBB"))}
+
+# Actions which do not take a value
+_NULLARY_ACTIONS = frozenset(("COPY_TTL_OUT", "COPY_TTL_IN", "POP_VLAN",
+                              "DEC_MPLS_TTL", "DEC_NW_TTL", "POP_PBB"))
+
+
+def _opcode_bit(opcode):
+    """ Returns the bit representing an instruction or action type """
+    try:
+        return _OPCODE_BITS[opcode]
+    except KeyError:
+        return _OPCODE_BITS.setdefault(opcode, 1 << len(_OPCODE_BITS))
+
+
+def _action_op_mask(actions):
+    """ Returns the opcode mask of all action types in an ActionList """
+    mask = 0
+    for action in actions:
+        mask |= _opcode_bit(action[0])
+    return mask
+
+
+def _instruction_op_mask(instructions):
+    """ Returns the opcode mask of the instructions set in Instructions
+
+        APPLY_ACTIONS and WRITE_ACTIONS are both represented by the
+        APPLY_ACTIONS bit, as either TTP instruction can place the actions
+        of both.
+    """
+    mask = 0
+    if instructions.apply_actions or instructions.write_actions:
+        mask |= _opcode_bit("APPLY_ACTIONS")
+    if instructions.goto_table is not None:
+        mask |= _opcode_bit("GOTO_TABLE")
+    if instructions.clear_actions:
+        mask |= _opcode_bit("CLEAR_ACTIONS")
+    return mask
+
+
+def _make_op_masks(ttp_list):
+    """ Sets the required and allowed opcode masks of a TTPList
+
+        Like TTPMatchSet._make_masks, but for the opcodes of instructions
+        and actions. An opcode is required if every valid combination
+        uses it, and allowed if it can be placed by any item in the list.
+    """
+    req_or = 0
+    req_and = None
+    allowed_mask = 0
+    for item in ttp_list:
+        r, a = item.get_op_masks()
+        req_or |= r
+        req_and = r if req_and is None else req_and & r
+        allowed_mask |= a
+    if ttp_list.meta_type == 'all':
+        required_mask = req_or
+    elif (ttp_list.meta_type in ('one_or_more', 'exactly_one') and
+          req_and is not None):
+        required_mask = req_and
+    else:
+        required_mask = 0
+    ttp_list.required_op_mask = required_mask
+    ttp_list.allowed_op_mask = allowed_mask | required_mask
+
+
+class Remaining(dict):
+    """ A class to collect all variations of a result
+
+        Maps each unplaced remainder to the set of possible build outs.
+        Setting an item adds to its set rather than replacing it, however
+        unlike a defaultdict reading a missing item raises a KeyError.
+    """
+    __slots__ = ()
 
     def __init__(self, init=None):
+        dict.__init__(self)
         if init is not None:
-            self.data = init
-        else:
-            self.data = {}
+            for k, v in viewitems(init):
+                dict.__setitem__(self, k, set(v))
 
     def update(self, other):
+        # Unlike self[k] |= v, this hashes k once rather than twice on a hit,
+        # which is significant for large Match and Instructions keys
+        get = self.get
         for k, v in viewitems(other):
-            if k in self.data:
-                self.data[k].update(v)
+            s = get(k)
+            if s is None:
+                dict.__setitem__(self, k, set(v))
             else:
-                self.data[k] = set(v)
+                s.update(v)
 
     def __setitem__(self, item, value):
-        if False and isinstance(value, set):
-            if item in self.data:
-                self.data[item].update(value)
-            else:
-                self.data[item] = set(value)
+        s = self.get(item)
+        if s is None:
+            dict.__setitem__(self, item, {value})
         else:
-            if item in self.data:
-                self.data[item].add(value)
-            else:
-                self.data[item] = set((value,))
-
-    def __getitem__(self, item): return self.data.__getitem__(item)
-
-    def __contains__(self, item): return self.data.__contains__(item)
-
-    def __delitem__(self, item): return self.data.__delitem__(item)
-
-    def __len__(self): return self.data.__len__()
-
-    def __iter__(self): return self.data.__iter__()
-
-    def iteritems(self): return self.data.iteritems()
-
-    def iterkeys(self): return self.data.iterkeys()
-
-    def itervalues(self): return self.data.itervalues()
-
-    def viewitems(self): return self.data.viewitems()
-
-    def viewvalues(self): return self.data.viewvalues()
-
-    def viewkeys(self): return self.data.viewkeys()
-
-    def items(self): return self.data.items()
-
-    def values(self): return self.data.values()
-
-    def keys(self): return self.data.keys()
-
-    def __str__(self): return self.data.__str__()
-
-    def __repr__(self): return self.data.__repr__()
+            s.add(value)
 
 
 @extend_class
 class TTPList(TTP.TTPList):
-    def _satisfies(self, item_in, build_out, final=True, filter_=None):
+    def _satisfies(self, item_in, build_out, final=True, items=None):
         """
         Checks the elements in the item_in list can be matched against our
         list of requirements considering the meta type (all, zero_or_more)
@@ -124,26 +171,32 @@ class TTPList(TTP.TTPList):
         Our items in 'self' are expected to all contain the _satisfies method
         and return a list of remaining items in a dict.
         build_out: The set of item_ins so far in an installable format
-        filter_: Allows items in this list to be skipped by returning True
-                Expected to have the type lambda x: x->bool
         final: Final will return only those empty items, i.e. fully satisfied
+        items: The items in this list to check, by default all of them.
+               Allows a subclass to skip some items.
         return: A dict of item_in: build_out pairs
         """
+        if items is None:
+            items = self
 
         # Our child can first check masks and then call super()
-        remaining = Remaining({item_in: set(build_out)})
+        remaining = Remaining({item_in: build_out})
         # Now we've got rid of those with no chance, lets verify all special
         # conditions are meet
         # debug()
         if self.meta_type == 'all':
             """ Try match every match, if at any point the list of possible
                 matches becomes empty we have failed """
-            for item in self:
-                if filter_ is not None and filter_(item):
-                    continue
-                tmp = Remaining()
-                for ii, bo in viewitems(remaining):
-                    tmp.update(item._satisfies(ii, bo, False))
+            for item in items:
+                if len(remaining) == 1:
+                    # Commonly there is a single placement so far, use the
+                    # item's result directly rather than merging into a copy
+                    (ii, bo), = viewitems(remaining)
+                    tmp = item._satisfies(ii, bo, False)
+                else:
+                    tmp = Remaining()
+                    for ii, bo in viewitems(remaining):
+                        tmp.update(item._satisfies(ii, bo, False))
                 # We have applied to them all, and have run out of possible
                 # placements. As all are required this means it cannot be done
                 if not tmp:
@@ -155,9 +208,7 @@ class TTPList(TTP.TTPList):
             results = Remaining()
             if self.meta_type == 'zero_or_one':
                 results.update(initial)
-            for item in self:
-                if filter_ is not None and filter_(item):
-                    continue
+            for item in items:
                 for ii, bo in viewitems(initial):
                     results.update(item._satisfies(ii, bo, False))
             remaining = results
@@ -173,9 +224,7 @@ class TTPList(TTP.TTPList):
                 could meet a one or more without changing the original
                 by encountering an optional instruction at the next level
             """
-            for item in self:
-                if filter_ is not None and filter_(item):
-                    continue
+            for item in items:
                 """ Add a changed copy, this might overwrite an existing if so
                     it is set to True """
                 tmp = Remaining()
@@ -200,98 +249,134 @@ class TTPList(TTP.TTPList):
 
 @extend_class
 class TTPAction(TTP.TTPAction):
+    _group = None
+
+    def get_group(self):
+        """ Returns the TTPGroup of a GROUP action
+
+            Looked up on first use and then cached.
+            Raises a LookupError if the group cannot be found
+        """
+        if self._group is None:
+            self._group = self.ttp.find_group(self.group_id)
+        return self._group
+
+    def get_op_masks(self):
+        """ Returns the (required, allowed) opcode masks of this action """
+        if self.action == "GROUP":
+            # A group places the actions of its buckets
+            return (0, -1)
+        if self.action == "SET_FIELD":
+            if self.field == "$ALLOW_VLAN_TRANSLATION":
+                return (0, 0)
+        bit = _opcode_bit(self.action)
+        return (bit, bit)
+
     def _satisfies(self, actions, build_out, final=True):
+        """
+            actions: ActionList, to be satisfied
+            build_out: A set of ActionLists representing currently
+                       satisfied portions
+            return: A Remaining mapping the unplaced actions to the set of
+                    ActionLists placed
+        """
         # Ignore the order for now
         # I think we still need to deal with the actions includes group case
         # :)
-        if isinstance(build_out, set):
-            r = Remaining()
-            for i in build_out:
-                r.update(self._satisfies(actions, i, final))
-            return r
-
         if self.action == "SET_FIELD":
             if self.field == "$ALLOW_VLAN_TRANSLATION":
-                return Remaining({actions: set((build_out,))})
+                return Remaining({actions: build_out})
 
         if actions is None:
             raise RuntimeError("I don't think this should happen")
+        if self.action in ("GROUP",):
+            if not actions:
+                return Remaining()
+            # Groups are yet even more actions, so we can try to match
+            # these
+            try:
+                group = self.get_group()
+            except KeyError:
+                self.log.warning("Could not find group %s, returning"
+                                 " unsatisfiable", self.group_id)
+                return Remaining()
+            r = Remaining()
+            for _build_out in build_out:
+                r.update(group._satisfies(actions, _build_out, final=False))
+            return r
+        op = self.action
         for action in actions:
-            if self.action in ("GROUP",):
-                # Groups are yet even more actions, so we can try to match
-                # these
-                try:
-                    group = self.ttp.find_group(self.group_id)
-                except KeyError:
-                    self.log.warning("Could not find group %s, returning"
-                                     " unsatisfiable", self.group_id)
-                    return Remaining()
-                return group._satisfies(actions, build_out, final=False)
-            if self.action == action[0]:
-                # Lets assume the action is valid for now
-                if action[0] in ("COPY_TTL_OUT", "COPY_TTL_IN", "POP_VLAN",
-                                 "DEC_MPLS_TTL", "DEC_NW_TTL", "POP_PBB"):
-                    assert action[1] is None
-                    tmp = actions.copy(remove=(action,))
-                    tmp_build_out = build_out.copy(add=(action,))
-                    tmp_build_out.binding += (self,)
-                    return Remaining({tmp: set((tmp_build_out,))})
-                if action[0] in ("SET_FIELD",):
-                    if self.field == action[1][0]:
-                        # Assume the value is valid
-                        tmp = actions.copy(remove=(action,))
-                        tmp_build_out = build_out.copy(add=(action,))
-                        tmp_build_out.binding += (self,)
-                        return Remaining({tmp: set((tmp_build_out,))})
-                elif action[0] in ("OUTPUT",):
-                    if ((not isinstance(self.port, integer_types)) or
-                            self.port == action[1]):
-                        tmp = actions.copy(remove=(action,))
-                        tmp_build_out = build_out.copy(add=(action,))
-                        tmp_build_out.binding += (self,)
-                        return Remaining({tmp: set((tmp_build_out,))})
-                else:
-                    # Assume we are good
-                    tmp = actions.copy(remove=(action,))
-                    tmp_build_out = build_out.copy(add=(action,))
-                    tmp_build_out.binding += (self,)
-                    return Remaining({tmp: set((tmp_build_out,))})
+            if op == action[0] and self._accepts(action):
+                return self._place(actions, build_out, action)
         return Remaining()
 
+    def _accepts(self, action):
+        """ Returns True if this TTPAction can place the action
+
+            action: An (action type, value) tuple of the same type as this
+        """
+        op = action[0]
+        # Lets assume the action is valid for now
+        if op in _NULLARY_ACTIONS:
+            assert action[1] is None
+            return True
+        if op == "SET_FIELD":
+            # Assume the value is valid
+            return self.field == action[1][0]
+        if op == "OUTPUT":
+            return (not isinstance(self.port, integer_types) or
+                    self.port == action[1])
+        # Assume we are good
+        return True
+
+    def _place(self, actions, build_out, action):
+        """ Moves action from actions to a copy of each of build_out
+
+            Only the selected placement is copied, the candidate actions
+            tried before it are not.
+        """
+        tmp = actions.copy(remove=(action,))
+        placed = set()
+        for _build_out in build_out:
+            tmp_build_out = _build_out.copy(add=(action,))
+            tmp_build_out.binding += (self,)
+            placed.add(tmp_build_out)
+        return Remaining({tmp: placed})
+
     def apply(self, actions_in, build_out, model):
         for action in actions_in:
             if self.action in ("GROUP",):
                 raise NotImplementedError(
                     "Applying group actions not yet implemented")
-            if self.action == action[0]:
-                if action[0] in ("COPY_TTL_OUT", "COPY_TTL_IN", "POP_VLAN",
-                                 "DEC_MPLS_TTL", "DEC_NW_TTL", "POP_PBB"):
-                    assert action[1] is None
-                    build_out.append(*action)
-                    actions_in.remove(action)
-                    return
-                if action[0] in ("SET_FIELD",):
-                    if self.field == action[1][0]:
-                        build_out.append(*action)
-                        actions_in.remove(action)
-                        return
-                elif action[0] in ("OUTPUT",):
-                    if ((not isinstance(self.port, integer_types)) or
-                            self.port == action[1]):
-                        build_out.append(*action)
-                        actions_in.remove(action)
-                        return
-                else:  # Assume we are good
-                    build_out.append(*action)
-                    actions_in.remove(action)
-                    return
+            if self.action == action[0] and self._accepts(action):
+                build_out.append(*action)
+                actions_in.remove(action)
+                return
         assert "Did not expect to reach here" == 0
 
 
 @extend_class
 class TTPActionList(TTP.TTPActionList):
+    required_op_mask = None
+    allowed_op_mask = None
+
+    @subclass
+    def __init__(base, self, *args, **kwargs):
+        base(self, *args, **kwargs)
+        _make_op_masks(self)
+
+    def get_op_masks(self):
+        return (self.required_op_mask, self.allowed_op_mask)
+
     # Order matters but lets ignore that for now
     def _satisfies(self, actions, build_out, final=True):
+        # Check the actions required by the TTP are present, and if final
+        # that every action can be placed
+        op_mask = _action_op_mask(actions)
+        if (op_mask & self.required_op_mask) != self.required_op_mask:
+            return Remaining()
+        if final and op_mask & ~self.allowed_op_mask:
+            return Remaining()
         remaining = TTPList._satisfies(self, item_in=actions,
                                        build_out=build_out, final=final)
         if final:
@@ -304,21 +389,18 @@ class TTPBucket(TTP.TTPBucket):
     def _satisfies(self, actions, build_out, final=False):
         """
             actions: ActionList
-            build_out: A tuple of buckets, or empty tuple
+            build_out: A set of tuples of buckets, or empty tuples
             final: Only return results where actions is empty
             return: A Remaining mapping of action to a set of tuples
         """
-        if isinstance(build_out, set):
-            ret = Remaining()
-            for _build_out in build_out:
-                ret.update(self._satisfies(actions, _build_out, final))
-            return ret
+        # The bucket placed does not depend on build_out, so find it once
         empty_bucket = Bucket()
         empty_bucket.ttp_link = self
-        res = self.action_set._satisfies(actions, set((empty_bucket,)), final=final)
+        res = self.action_set._satisfies(actions, {empty_bucket}, final=final)
         remaining = Remaining()
         for k, vs in viewitems(res):
-            remaining.update({k: {build_out + (v,) for v in vs}})
+            remaining.update({k: {_build_out + (v,) for _build_out in build_out
+                                  for v in vs}})
         if final:
             return Remaining({k: v for k, v in viewitems(remaining) if len(k) == 0})
         return remaining
@@ -341,8 +423,7 @@ class TTPGroup(TTP.TTPGroup):
         combinations = []
 
         for output in outputs:
-            excluding_outputs = [x for x in outputs
-                                 if x[0] == "OUTPUT" and x != output]
+            excluding_outputs = [x for x in outputs if x != output]
             new_act = actions.copy(remove=excluding_outputs)
             # Drop any actions applied after the output
             while new_act[-1][0] != "OUTPUT":
@@ -355,7 +436,7 @@ class TTPGroup(TTP.TTPGroup):
         """ Build out is still a single item """
         if self.group_type == "INDIRECT":
             # Set of a bucket list i.e. a tuple
-            ret = self.bucket_types._satisfies(actions, set(((),)),
+            ret = self.bucket_types._satisfies(actions, {()},
                                                final=False)
             nret = Remaining()
             for unplaced, places in viewitems(ret):
@@ -397,7 +478,7 @@ class TTPGroup(TTP.TTPGroup):
                 for new_act in combinations:
                     # TODO Do we have to do this as a final, otherwise
                     # we might not be able to entirely remove the action
-                    r = bucket._satisfies(new_act, set(((),)),
+                    r = bucket._satisfies(new_act, {()},
                                           final=False)
                     # Strip the list of buckets i.e. the tuple, and we will have just one Bucket
                     for places in viewvalues(r):
@@ -415,15 +496,17 @@ class TTPGroup(TTP.TTPGroup):
             # strips vlan and one that does not, and an output on each.
             # I think we really need to separate each output path to do this
             # properly
-            l = len(outputs)
             results = Remaining()
-            while l >= len(outputs) and len(set_remaining):
-                most_maxed_out = max(set_remaining,
-                                     key=lambda x: len(set_remaining[x]))
+            all_outputs = set(outputs)
+            # Try the remainders which placed the most outputs first, the
+            # lengths do not change so we only need to sort once. Like max()
+            # the sort is stable and keeps the first of any ties first.
+            for most_maxed_out in sorted(set_remaining,
+                                         key=lambda x: len(set_remaining[x]),
+                                         reverse=True):
                 items = set_remaining[most_maxed_out]
-                l = len(items)
                 acheived_outputs = set([get_output(x[0]) for x in items])
-                if acheived_outputs == set(outputs):
+                if acheived_outputs == all_outputs:
                     g = Group()
                     g.ttp_link = self
                     g.type_ = "ALL"
@@ -431,7 +514,8 @@ class TTPGroup(TTP.TTPGroup):
                     tmp_build_out = build_out.copy(add=(("GROUP", g),))
                     tmp_build_out.binding += (self,)
                     results[most_maxed_out] = tmp_build_out
-                del set_remaining[most_maxed_out]
+                if len(items) < len(outputs):
+                    break
             # debug()
             return results
         if self.group_type == "FF":
@@ -493,6 +577,36 @@ class TTPGroup(TTP.TTPGroup):
 
 @extend_class
 class TTPInstruction(TTP.TTPInstruction):
+    _table_number = None
+
+    def get_table_number(self):
+        """ Returns the table number of a GOTO_TABLE instruction
+
+            Looked up on first use and then cached, as when constructed
+            the table may not have been loaded yet.
+        """
+        if self._table_number is None:
+            self._table_number = self.ttp.find_table(self.table).number
+        return self._table_number
+
+    def get_op_masks(self):
+        """ Returns the (required, allowed) opcode masks of this instruction
+
+            See _instruction_op_mask for the opcodes of Instructions
+        """
+        if self.instruction in ("APPLY_ACTIONS", "WRITE_ACTIONS"):
+            bit = _opcode_bit("APPLY_ACTIONS")
+            # Required actions can only come from an apply or write
+            if self.actions.required_op_mask:
+                return (bit, bit)
+            return (0, bit)
+        if self.instruction in ("GOTO_TABLE", "CLEAR_ACTIONS"):
+            # These are always satisfied, see _satisfies
+            return (0, _opcode_bit(self.instruction))
+        if self.instruction == "METER":
+            return (0, 0)
+        return (0, -1)
+
     def _satisfies(self, instructions, build_out, final=False):
         """
             instructions: Instructions, to be satisfied
@@ -500,84 +614,92 @@ class TTPInstruction(TTP.TTPInstruction):
                        satisfied portions
             final: If final return only the fully satisfied results
         """
-        if isinstance(build_out, set):
-            r = Remaining()
-            for x in build_out:
-                r.update(self._satisfies(instructions, x, final))
-            return r
-
         if self.instruction == "GOTO_TABLE":
             # For now always remove this :) TODO XXX
             if instructions.goto_table == self.table or True:
-                nbuild_out = Instructions(build_out)
-                assert nbuild_out.goto_table is None
-                nbuild_out.goto_table = self.ttp.find_table(self.table).number
-                nbuild_out.binding += (self,)
+                table_number = self.get_table_number()
+                placed = set()
+                for _build_out in build_out:
+                    nbuild_out = Instructions(_build_out)
+                    assert nbuild_out.goto_table is None
+                    nbuild_out.goto_table = table_number
+                    nbuild_out.binding += (self,)
+                    placed.add(nbuild_out)
                 cpy = Instructions(instructions)
                 cpy.goto_table = None
-                return Remaining({cpy: set((nbuild_out,))})
+                return Remaining({cpy: placed})
             else:
                 return Remaining()
         elif self.instruction in ("APPLY_ACTIONS", "WRITE_ACTIONS"):
             merged_actions = ActionList(instructions.apply_actions)
             merged_actions += instructions.write_actions
-            if self.instruction == "APPLY_ACTIONS":
-                ret = self.actions._satisfies(merged_actions,
-                                              set((build_out.apply_actions,)),
-                                              False)
-            else:
-                ret = self.actions._satisfies(merged_actions,
-                                              set((build_out.write_actions,)),
-                                              False)
             rets = Remaining()
-            for k, vs in viewitems(ret):
-                cpy = Instructions(instructions)
-                to_remove = []
-                for x in cpy.apply_actions:
-                    if x not in k:
-                        to_remove.append(x)
-                for x in to_remove:
-                    cpy.apply_actions.remove(x)
-
-                to_remove = []
-                for x in cpy.write_actions:
-                    if x not in k:
-                        to_remove.append(x)
-                for x in to_remove:
-                    cpy.write_actions.remove(x)
+            # The remaining instructions for each set of unplaced actions,
+            # these are often the same across build_out
+            unplaced_instructions = {}
+            for _build_out in build_out:
                 if self.instruction == "APPLY_ACTIONS":
-                    for v in vs:
-                        cpy_inst = Instructions(build_out)
-                        cpy_inst.apply_actions = v
-                        rets[cpy] = cpy_inst
+                    ret = self.actions._satisfies(
+                        merged_actions, {_build_out.apply_actions}, False)
                 else:
-                    for v in vs:
-                        cpy_inst = Instructions(build_out)
-                        cpy_inst.write_actions = v
-                        rets[cpy] = cpy_inst
+                    ret = self.actions._satisfies(
+                        merged_actions, {_build_out.write_actions}, False)
+                for k, vs in viewitems(ret):
+                    cpy = unplaced_instructions.get(k)
+                    if cpy is None:
+                        cpy = self._keep_unplaced(instructions, k)
+                        unplaced_instructions[k] = cpy
+                    if self.instruction == "APPLY_ACTIONS":
+                        for v in vs:
+                            cpy_inst = Instructions(_build_out)
+                            cpy_inst.apply_actions = v
+                            rets[cpy] = cpy_inst
+                    else:
+                        for v in vs:
+                            cpy_inst = Instructions(_build_out)
+                            cpy_inst.write_actions = v
+                            rets[cpy] = cpy_inst
             return rets
         elif self.instruction == "METER":
             # IGNORE meters for now
-            return Remaining({instructions: set((build_out,))})
+            return Remaining({instructions: build_out})
         elif self.instruction == "CLEAR_ACTIONS":
             # Always add clear actions regardless of original
-            nbuild_out = Instructions(build_out)
-            assert nbuild_out.clear_actions is None
-            nbuild_out.clear_actions = True
-            nbuild_out.binding += (self,)
+            placed = set()
+            for _build_out in build_out:
+                nbuild_out = Instructions(_build_out)
+                assert nbuild_out.clear_actions is None
+                nbuild_out.clear_actions = True
+                nbuild_out.binding += (self,)
+                placed.add(nbuild_out)
             cpy = Instructions(instructions)
             cpy.clear_actions = None
-            return Remaining({cpy: set((nbuild_out,))})
+            return Remaining({cpy: placed})
         raise NotImplementedError("satisfies() instruction " +
                                   self.instruction + " not implemented")
         # TODO meta-data and meters etc
 
+    @staticmethod
+    def _keep_unplaced(instructions, unplaced):
+        """ Returns a copy of instructions with only the unplaced actions
+
+            instructions: The Instructions to copy
+            unplaced: The actions which were not placed
+        """
+        unplaced = set(unplaced)
+        cpy = Instructions(instructions)
+        for actions in (cpy.apply_actions, cpy.write_actions):
+            to_remove = [x for x in actions if x not in unplaced]
+            for x in to_remove:
+                actions.remove(x)
+        return cpy
+
     def apply(self, inst_in, build_out, model):
         if self.instruction == "GOTO_TABLE":
             # We always allow any goto table do this
             assert build_out.goto_table is None
             inst_in.goto_table = None
-            build_out.goto_table = self.ttp.find_table(self.table).number
+            build_out.goto_table = self.get_table_number()
         elif self.instruction in ("APPLY_ACTIONS", "WRITE_ACTIONS"):
             raise RuntimeError("not expected, call apply and write directly")
         elif self.instruction == "METER":
@@ -592,7 +714,40 @@ class TTPInstruction(TTP.TTPInstruction):
 
 @extend_class
 class TTPInstructionSet(TTP.TTPInstructionSet):
+    required_op_mask = None
+    allowed_op_mask = None
+
+    @subclass
+    def __init__(base, self, *args, **kwargs):
+        base(self, *args, **kwargs)
+        _make_op_masks(self)
+
+    def get_op_masks(self):
+        return (self.required_op_mask, self.allowed_op_mask)
+
+    def _possible(self, instructions, final=True):
+        """ Checks the instructions required by the TTP are present, and if
+            final that every instruction can be placed
+
+            This only compares opcode masks, so is cheap. A False result
+            means _satisfies would find no placement.
+        """
+        op_mask = _instruction_op_mask(instructions)
+        if (op_mask & self.required_op_mask) != self.required_op_mask:
+            return False
+        if final and op_mask & ~self.allowed_op_mask:
+            return False
+        return True
+
     def _satisfies(self, instructions, build_out, final=True):
+        if not self._possible(instructions, final):
+            return Remaining()
+        return self._place(instructions, build_out, final)
+
+    def _place(self, instructions, build_out, final=True):
+        """ _satisfies, without first checking the instructions are
+            _possible()
+        """
         remaining = TTPList._satisfies(self, item_in=instructions,
                                        build_out=build_out, final=final)
         # if this is the final any result that has used all matches is valid
@@ -603,13 +758,15 @@ class TTPInstructionSet(TTP.TTPInstructionSet):
 
     def satisfies(self, instructions):
         return len(self._satisfies(instructions,
-                                   set((Instructions(),)))) > 0
+                                   {Instructions()})) > 0
 
 
 @extend_class
 class TTPMatchSet(TTP.TTPMatchSet):
     required_mask = None
     optional_mask = None
+    allowed_mask = None  # The union of the required and optional masks
+    standard_matches = None  # The matches checked by _satisfies
 
     @subclass
     def __init__(base, self, *args, **kwargs):
@@ -620,14 +777,15 @@ class TTPMatchSet(TTP.TTPMatchSet):
         return (self.required_mask, self.optional_mask)
 
     def _make_masks(self):
-        self.required_mask = 0
-        self.optional_mask = 0
-        opt_masks = []  # Children's masks
-        req_masks = []  # Children's masks
+        # Merge the children's masks in a single pass
+        req_or = 0
+        opt_or = 0
+        req_and = None
         for match in self:
             r, o = match.get_masks()
-            opt_masks.append(o)
-            req_masks.append(r)
+            req_or |= r
+            opt_or |= o
+            req_and = r if req_and is None else req_and & r
         # permissively merge based on meta
         # i.e. required should only include fields required in
         # all cases otherwise we will incorrectly filter these out
@@ -635,54 +793,51 @@ class TTPMatchSet(TTP.TTPMatchSet):
             """We still require all required fields from each match
                and optionally can include any optional fields.
             """
-            self.required_mask = reduce(lor, req_masks, 0)
-            self.optional_mask = reduce(lor, opt_masks, 0)
+            self.required_mask = req_or
+            self.optional_mask = opt_or
         elif self.meta_type in ('one_or_more', 'exactly_one'):
             """ At least one must be picked, a field is required if each match
                 includes it. And all the others are optional.
             """
-            if not req_masks:
+            if req_and is None:
                 assert "Invalid request for one or more with 0 sized set" == 0
-            self.required_mask = reduce(land, req_masks)
-            self.optional_mask = (reduce(lor, req_masks, 0) |
-                                  reduce(lor, opt_masks, 0))
+            self.required_mask = req_and
+            self.optional_mask = req_or | opt_or
         elif self.meta_type in ('zero_or_more', 'zero_or_one'):
             """ In the zero case nothing is required, therefore everything is
                 optional """
             self.required_mask = 0
-            self.optional_mask = (reduce(lor, req_masks, 0) |
-                                  reduce(lor, opt_masks, 0))
+            self.optional_mask = req_or | opt_or
         else:
             assert "Oooops we made a bad class" == 0
         # Ensure that optional don't overlap the required
         self.optional_mask &= ~self.required_mask
+        self.allowed_mask = self.required_mask | self.optional_mask
+        # For now skip fields that are not in the spec, we can
+        # probably set these to 0 anyway
+        self.standard_matches = [m for m in self
+                                 if not isinstance(m, TTPMatch) or
+                                 m.is_standard_field()]
 
     def _satisfies(self, matches, build_out, final=True):
         """ A recursive version of matches which allows a partial match
             and returns a set of all remaining possible match combinations """
         # Check we have the required fields
-        r_mask, o_mask = self.get_masks()
+        fields = matches.required_mask
+        r_mask = self.required_mask
         # Check we set all fields which are required to be set by the TTP
-        if (matches.required_mask & r_mask) != r_mask:
+        if (fields & r_mask) != r_mask:
             return Remaining()
         # If this is the final, we must ensure the field set is empty
         # Check the fields are not encompassed by all compulsory and optional
         # it means we cannot represent the ryu_match
-        if final and ((matches.required_mask & (o_mask | r_mask)) !=
-                      matches.required_mask):
+        if final and fields & ~self.allowed_mask:
             return Remaining()
 
-        def filter_(ttp_m):
-            if isinstance(ttp_m, TTPMatch):
-                # For now skip fields that are not in the spec, we can
-                # probably set these to 0 anyway
-                if not ttp_m.is_standard_field():
-                    return True
-            return False
         # TTPList knows all about meta and handles this for us
         remaining = TTPList._satisfies(self, item_in=matches,
                                        build_out=build_out, final=final,
-                                       filter_=filter_)
+                                       items=self.standard_matches)
 
         # if this is the final any result that has used all matches is valid
         if final:
@@ -693,7 +848,7 @@ class TTPMatchSet(TTP.TTPMatchSet):
     def satisfies(self, match):
         """ Match: A Match object with all matches of the flow appended
         """
-        return len(self._satisfies(match, Match())) > 0
+        return len(self._satisfies(match, {Match()})) > 0
 
 
 @extend_class
@@ -715,41 +870,51 @@ class TTPFlow(TTP.TTPFlow):
         else:
             ret.priority = flow.priority
         ret.table = self.walk_parents(TTP.TTPTable).number
+        # Rule out the instructions by their opcodes before the more
+        # expensive walk of the match set
+        instruction_set = self.instruction_set
+        if not instruction_set._possible(flow.instructions, final):
+            return Remaining()
         res_matches = self.match_set._satisfies(flow.match,
-                                                set((Match(),)),
+                                                {Match()},
                                                 final=final)
         if not res_matches:
             return Remaining()
 
-        res_instructions = self.instruction_set._satisfies(
-            flow.instructions, set((Instructions(),)), final=final)
+        res_instructions = instruction_set._place(
+            flow.instructions, {Instructions()}, final=final)
         if not res_instructions:
             return Remaining()
 
         for mk, _mv in viewitems(res_matches):
-            for mv in _mv:
-                for ik, _iv in viewitems(res_instructions):
+            for ik, _iv in viewitems(res_instructions):
+                # The remaining flow only depends on mk and ik
+                nflow = flow.copy()
+                nflow.match = mk
+                nflow.instructions = ik
+                placed = set()
+                for mv in _mv:
                     for iv in _iv:
-                        nflow = flow.copy()
-                        nflow.match = mk
-                        nflow.instructions = ik
                         nflow_out = ret.copy()
                         nflow_out.match = mv
                         nflow_out.instructions = iv
-                        rets[nflow] = nflow_out
-
-        for v in viewvalues(rets):
-            assert isinstance(v, set)
-            for a in v:
-                assert isinstance(a, Rule)
-                assert isinstance(a.match, Match)
-                assert isinstance(a.instructions, Instructions)
-                assert isinstance(a.instructions.apply_actions, ActionList)
-                assert isinstance(a.instructions.write_actions, ActionList)
-                assert hasattr(a.instructions, "binding")
-                assert hasattr(a.instructions.apply_actions, "binding")
-                assert hasattr(a.instructions.write_actions, "binding")
-                assert hasattr(a.match, "binding")
+                        placed.add(nflow_out)
+                if placed:
+                    rets.update({nflow: placed})
+
+        if __debug__ and _TTP_DEEP_CHECK:
+            for v in viewvalues(rets):
+                assert isinstance(v, set)
+                for a in v:
+                    assert isinstance(a, Rule)
+                    assert isinstance(a.match, Match)
+                    assert isinstance(a.instructions, Instructions)
+                    assert isinstance(a.instructions.apply_actions, ActionList)
+                    assert isinstance(a.instructions.write_actions, ActionList)
+                    assert hasattr(a.instructions, "binding")
+                    assert hasattr(a.instructions.apply_actions, "binding")
+                    assert hasattr(a.instructions.write_actions, "binding")
+                    assert hasattr(a.match, "binding")
         return rets
 
     @staticmethod
@@ -850,14 +1015,19 @@ class TTPMatch(TTP.TTPMatch):
         res = Remaining()
         if not self.is_required():
             res.update({match_in: build_out})
-        if self.field_name in match_in:
-            match = match_in[self.field_name]
-            if self.satisfies(match[0], match[1]):
-                tmp_match_in = match_in.copy(remove=((self.field_name,),))
+        field_name = self.field_name
+        if field_name in match_in:
+            match = match_in[field_name]
+            value = match[0]
+            mask = match[1]
+            if self.satisfies(value, mask):
+                tmp_match_in = match_in.copy(remove=((field_name,),))
+                add = ((field_name, value, mask),)
+                binding = (self,)
                 tmp_build_out = set()
                 for m in build_out:
-                    nm = m.copy(add=((self.field_name, match[0], match[1]),))
-                    nm.binding += (self,)
+                    nm = m.copy(add=add)
+                    nm.binding += binding
                     tmp_build_out.add(nm)
                 res.update({tmp_match_in: tmp_build_out})
         return res
@@ -874,47 +1044,80 @@ class TTPMatch(TTP.TTPMatch):
             self.log.warning("Unable to check prefix as field width for %s"
                              " is unknown", self.field_name)
             return True
-        highest_bit = (self.width_mask + 1) >> 1
-        while highest_bit & mask == highest_bit:
-            # switch off the highest bit if it is on
-            mask &= ~highest_bit
-            mask <<= 1
-        return mask == 0
+        # A prefix is all ones above the highest unset bit within the width
+        width_mask = self.width_mask
+        unset = (~mask & width_mask).bit_length()
+        return mask == width_mask ^ ((1 << unset) - 1)
 
     def satisfies(self, value, mask):
         """ True if the value and mask meets all requirements, otherwise
             False indicating that the value and mask do not match
         """
+        # This is called for every candidate match, so satisfies_const,
+        # satisfies_mask and satisfies_value are inlined here
 
         # Check the required constant bits are set to the correct values
-        if not self.satisfies_const(value, mask):
-            return False
-        if not self.satisfies_mask(mask):
-            return False
-        if not self.satisfies_value(value, mask):
-            return False
-        if self.match_type == 'exact':
-            if self.mask is not None:
-                raise "Invalid combination of one of mask and match_type=exact"
-            if mask is not None and mask & self.width_mask != self.width_mask:
+        const_mask = self.const_mask
+        if const_mask:
+            # Our mask must include the same bits as the const_mask
+            if mask is not None and (mask & const_mask) != const_mask:
                 return False
-            return True
-        if self.match_type == 'all_or_exact':
-            if self.mask is not None:
-                raise "Invalid combination of one of mask and match_type=exact"
-            if (mask is not None and
-                    mask & self.width_mask not in (0, self.width_mask)):
+            if (const_mask & value) != self.const_value:
                 return False
-            return True
-        if self.match_type == 'prefix':
+        # Check the mask
+        self_mask = self.mask
+        if self_mask is not None:
             if mask is None:
-                return True
-            mask &= self.width_mask
-            return self.is_prefix_mask(mask)
-        if self.match_type == 'mask':
-            # Any mask matches an arbitrary mask
+                # No mask is the same as a fully matched mask
+                if self.width_mask != self_mask:
+                    return False
+            elif const_mask:
+                if (const_mask | self_mask) != mask:
+                    return False
+            elif self_mask != mask:
+                return False
+        # Check the value
+        self_value = self.value
+        if self_value is not None:
+            if mask is not None:
+                if (self_value & mask) != (value & mask):
+                    return False
+            elif self_value != value:
+                return False
+        try:
+            check_match_type = self._MATCH_TYPE_CHECKS[self.match_type]
+        except KeyError:
+            raise ValueError("Bad match_type")
+        return check_match_type(self, mask)
+
+    def _check_exact(self, mask):
+        if self.mask is not None:
+            raise ValueError("Invalid combination of one of mask and "
+                             "match_type=exact")
+        return mask is None or mask & self.width_mask == self.width_mask
+
+    def _check_all_or_exact(self, mask):
+        if self.mask is not None:
+            raise ValueError("Invalid combination of one of mask and "
+                             "match_type=all_or_exact")
+        return mask is None or mask & self.width_mask in (0, self.width_mask)
+
+    def _check_prefix(self, mask):
+        if mask is None:
             return True
-        raise ValueError("Bad match_type")
+        return self.is_prefix_mask(mask & self.width_mask)
+
+    def _check_mask(self, mask):
+        # Any mask matches an arbitrary mask
+        return True
+
+    # The match_type specific check of satisfies(), given the mask
+    _MATCH_TYPE_CHECKS = {
+        'exact': _check_exact,
+        'all_or_exact': _check_all_or_exact,
+        'prefix': _check_prefix,
+        'mask': _check_mask
+        }
 
 
 @extend_class
@@ -941,52 +1144,50 @@ class TableTypePattern(TTP.TableTypePattern):
             print("\t\tAttempting to place rule in table", table.name,
                   "checking the following paths:", working_paths)
 
-        # Find all possible (to, from) combinations
-        # Then accept any path in which every to, from is meet
-        new_paths = []
-
+        # Accept any path in which every (from, to) edge can be met.
+        # Edges are only checked when first needed, so those only used by
+        # paths which have already failed are never checked.
         def to_tofrom(path):
-            return tuple([(path[i], path[i+1]) for i in range(0, len(path)-1)])
-
-        for path in working_paths:
-            new_paths.append(to_tofrom(path))
-
-        to_from_set = set()
-        for path in new_paths:
-            to_from_set.update(path)
-        can_make_it = defaultdict(list)
-
-        for from_table, to_table in to_from_set:
+            return tuple(zip(path, path[1:]))
+
+        can_make_it = {}
+        # A flow can go to multiple tables, only check each once
+        sat_cache = {}
+
+        def edge_flows(edge):
+            """ Returns the list of flows which can take edge (from, to) """
+            if edge in can_make_it:
+                return can_make_it[edge]
+            from_table, to_table = edge
+            flows = []
             tos = self.find_table(from_table).tos[self.find_table(to_table)]
             for flow in tos:
                 # Iterate all flows going to the next table, including bifms
                 # We want a rule allowing all packets, however special fields
                 # can be set to 0 and overlapping matches may be filtered to
                 # only include parts relevant to this match
-                res = flow._satisfies(fitting_flow, final=False)
-                if res:
+                if flow in sat_cache:
+                    sat = sat_cache[flow]
+                else:
+                    sat = flow._satisfies(fitting_flow, final=False)
+                    sat_cache[flow] = sat
+                if sat:
                     if flow.built_in:
-                        can_make_it[(from_table, to_table)].append(flow)
+                        flows.append(flow)
                     else:
                         # Lets pick one, for now we use the most permissive
                         # In the case there are two or more only one is picked
-                        picked, flow_out = max(viewitems(res),
+                        picked, flow_out = max(viewitems(sat),
                                                key=lambda k: len(k[0].match))
-                        can_make_it[(from_table, to_table)].append(flow_out)
-
-        valid_paths = []
-        pure_paths = set(can_make_it)
-        for path in new_paths:
-            if set(path).issubset(pure_paths):
-                index = new_paths.index(path)
-                valid_paths.append(working_paths[index])
+                        flows.append(flow_out)
+            can_make_it[edge] = flows
+            return flows
 
         res = {}
-        for p in valid_paths:
-            flow_opts = []
-            for i in range(0, len(p)-1):
-                flow_opts.append(can_make_it[(p[i], p[i+1])])
-            res[p] = tuple(flow_opts)
+        for path in working_paths:
+            edges = to_tofrom(path)
+            if all(edge_flows(edge) for edge in edges):
+                res[path] = tuple([can_make_it[edge] for edge in edges])
 
         # Returns {path: [([flows],...), ([flows], ...) ]}
         return res
@@ -71,6 +71,14 @@ class subclass(tuple):
         return tuple.__new__(cls, (a,))
 
 
+def _bind_base(func, base_func):
+    """ Returns a function calling func with base_func as the first argument
+    """
+    def with_base(*args, **kwargs):
+        return func(base_func, *args, **kwargs)
+    return with_base
+
+
 def extend_class(*replace):
     """
     A decorator that merges the decorated class into the base classes directly.
@@ -110,12 +118,9 @@ def extend_class(*replace):
                 elif isinstance(v, subclass):
                     # Is it a normal function, it is not a (unbound) method yet
                     if isinstance(v[0], types.FunctionType):
-                        func = functools.partial(v[0], base.__dict__[k])
-                        # Wrap back as a standard function make it bind
-                        # We have bind this in specially otherwise we
-                        # get stuck with only using only the latest function
-                        x = lambda f, *a, **b: lambda *a, **b: f(*a, **b)
-                        setattr(base, k, x(func))
+                        # A partial does not bind as a method, so use a
+                        # standard function closing over this base function
+                        setattr(base, k, _bind_base(v[0], base.__dict__[k]))
                     # It is a special type (static/class), we make it unspecial
                     # for the partial and special for the install
                     else:
@@ -141,6 +146,29 @@ def expect_list(obj):
     return obj if isinstance(obj, list) else [obj]
 
 
+_SAFE_MATHS_NODES = (ast.Expression, ast.BinOp, ast.UnaryOp, ast.operator,
+                     ast.unaryop, ast.Num)
+_safe_maths_cache = {}  # expr -> compiled code
+
+
+def _compile_safe_maths(expr):
+    """ Returns the compiled code of a maths expression, cached by expr
+
+        Raises a ValueError if expr contains anything other than numbers
+        and operators
+    """
+    try:
+        return _safe_maths_cache[expr]
+    except KeyError:
+        pass
+    tree = ast.parse(expr, mode='eval')
+    if not all(isinstance(n, _SAFE_MATHS_NODES) for n in ast.walk(tree)):
+        raise ValueError(" contains more than numbers and operators")
+    code = compile(tree, '<ttp>', 'eval')
+    _safe_maths_cache[expr] = code
+    return code
+
+
 def safe_eval_maths(expr):
     """
     Safely evaluates a maths expression,
@@ -150,13 +178,8 @@ def safe_eval_maths(expr):
     Note: This is still susceptible to memory or CPU exhaustion by putting
           in large numbers.
     """
-    allowed = (ast.Expression, ast.BinOp, ast.UnaryOp, ast.operator,
-               ast.unaryop, ast.Num)
     try:
-        tree = ast.parse(expr, mode='eval')
-        valid = all(isinstance(n, allowed) for n in ast.walk(tree))
-        if valid:
-            return eval(expr, {"__builtins__": None})
+        return eval(_compile_safe_maths(expr), {"__builtins__": None})
     except Exception as e:
         raise ValueError("Refusing to execute " + expr + str(e))
 
@@ -166,8 +189,11 @@ class _OffsetDict(dict):
     """ Used by _load_tracked_json stores the starting and ending character
         offset from the original source
     """
-    char_start = None  # The starting char offset in the original JSON
-    char_end = None  # The ending char offset in the original JSON
+    # char_start: The starting char offset in the original JSON
+    # char_end: The ending char offset in the original JSON
+    # Slots avoid a __dict__ per JSON object, these are always set by
+    # _load_tracked_json
+    __slots__ = ('char_start', 'char_end')
 
 
 def _load_tracked_json(fp, use_loads=False):
@@ -193,8 +219,9 @@ def _load_tracked_json(fp, use_loads=False):
         assert isinstance(obj, dict)
         frame = inspect.currentframe()
         if frame:  # Might work but who knows?
-            parents = inspect.getouterframes(frame, 2)
-            parent_locals = parents[1][0].f_locals
+            # The caller is the JSON parser, getouterframes would be much
+            # slower as it also loads the source context of every frame
+            parent_locals = frame.f_back.f_locals
             start = parent_locals['s_and_end'][1]
             end = parent_locals['end']
             obj = _OffsetDict(obj)
@@ -23,6 +23,8 @@ import json
 import logging
 import argparse
 import io
+import heapq
+from collections import deque
 
 from .TTP import TableTypePattern
 
@@ -86,11 +88,15 @@ def generate_issue_list(issues, source):
 NEWLINE_SPAN = u'<span class="line"></span>'
 
 
+# Escapes HTML and marks newlines in a single pass, as html_escape(s, False)
+# Keyed by ordinal so this works with unicode.translate in python 2
+_ESCAPE_LINES_TABLE = {ord(u"&"): u"&amp;", ord(u"<"): u"&lt;",
+                       ord(u">"): u"&gt;", ord(u"\n"): u"\n" + NEWLINE_SPAN}
+
+
 def _escape_lines(string):
     """ Escapes and marks newlines """
-    escaped = html_escape(string, False)
-    escaped = escaped.replace(u"\n", u'\n' + NEWLINE_SPAN)
-    return escaped
+    return string.translate(_ESCAPE_LINES_TABLE)
 
 
 def generate_listing(issues, source):
@@ -115,46 +121,92 @@ def generate_listing(issues, source):
 
         see also: generate_issue_list
     """
-    issues = list(issues)
+    issues = deque(issues)
     active = []  # A list of current issues on this source line
+    ends = []  # A heap of the end offsets of the active issues
     offset = 0
-    o_str = NEWLINE_SPAN
+    parts = [NEWLINE_SPAN]
 
     while active or issues:
         if active:
             # Get the next issue to close
-            min_active = min(active, key=lambda x: x[2])
-            if not issues or min_active[2] <= issues[0][1]:
-                o_str += _escape_lines(source[offset:min_active[2]])
-                o_str += u'</span>'
-                offset = min_active[2]
-                while active and min_active[2] == offset:
-                    active.remove(min_active)
-                    if active:
-                        min_active = min(active, key=lambda x: x[2])
+            min_end = ends[0]
+            if not issues or min_end <= issues[0][1]:
+                parts.append(_escape_lines(source[offset:min_end]))
+                parts.append(u'</span>')
+                offset = min_end
+                # Close all issues ending here
+                while ends and ends[0] == offset:
+                    heapq.heappop(ends)
+                active = [x for x in active if x[2] != offset]
             else:
-                o_str += _escape_lines(source[offset:issues[0][1]])
-                o_str += u'</span>'
+                parts.append(_escape_lines(source[offset:issues[0][1]]))
+                parts.append(u'</span>')
                 offset = issues[0][1]
                 while issues and issues[0][1] == offset:
                     active.append(issues[0])
-                    issues = issues[1:]
+                    heapq.heappush(ends, issues[0][2])
+                    issues.popleft()
         else:
-            o_str += _escape_lines(source[offset:issues[0][1]])
+            parts.append(_escape_lines(source[offset:issues[0][1]]))
             offset = issues[0][1]
             while issues and issues[0][1] == offset:
                 active.append(issues[0])
-                issues = issues[1:]
-        title = u""
-        for issue in reversed(active):
-            title += u"&bull;" + html_escape(issue[0], True) + "\n"
+                heapq.heappush(ends, issues[0][2])
+                issues.popleft()
+        title = u"".join([u"&bull;" + html_escape(issue[0], True) + u"\n"
+                          for issue in reversed(active)])
         if title:
-            o_str += (u'<span title="%s" id="%s" style="background:'
-                      u' rgba(255, 0, 0, 0.%s);">' %
-                      (title, offset, min(len(active), 9)))
+            parts.append(u'<span title="%s" id="%s" style="background:'
+                         u' rgba(255, 0, 0, 0.%s);">' %
+                         (title, offset, min(len(active), 9)))
+
+    parts.append(_escape_lines(source[offset:]))
+    return u"".join(parts)
+
+
+# The HTML report surrounding the issue list and listing, these are
+# formatted with % as the CSS includes braces
+# % (number of issues,)
+_HTML_HEAD = u"""<!DOCTYPE html>
+    <html lang="en">
+        <head>
+            <meta charset="UTF-8">
+            <title>TTP Validator</title>
+            <style>
+                body {
+                    counter-reset: l_counter;
+                }
+                .line::before {
+                        counter-increment: l_counter;
+                        content: counter(l_counter);
+                        display: inline-block;
+                        border-right: 1px solid #ddd;
+                        padding: 0 .5em;
+                        margin-right: .5em;
+                        min-width: 5ch;
+                        color: #888;
+                }
+            </style>
+        </head>
+        <body style='background: white;'>
+            <h1>TTP Validator</h1>
+            <h2>Issues Detected (%d)</h2>
+            <ol>
+    """
+
+# % (escaped TTP filename,)
+_HTML_MIDDLE = u"""
+            </ol>
+            <h2>Annotated Table Type Pattern %s</h2>
+            <pre>"""
+
+_HTML_TAIL = u"""
+            </pre>
+        </body>
+    </html>
+    """
 
-    o_str += _escape_lines(source[offset:])
-    return o_str
 
 def main():
     """ Generates an html report of a table type pattern's issues
@@ -190,46 +242,13 @@ def main():
     sort_issues(issues)
 
     with open(args.output, 'w') as fout:
-        fout.write(u"""<!DOCTYPE html>
-    <html lang="en">
-        <head>
-            <meta charset="UTF-8">
-            <title>TTP Validator</title>
-            <style>
-                body {
-                    counter-reset: l_counter;
-                }
-                .line::before {
-                        counter-increment: l_counter;
-                        content: counter(l_counter);
-                        display: inline-block;
-                        border-right: 1px solid #ddd;
-                        padding: 0 .5em;
-                        margin-right: .5em;
-                        min-width: 5ch;
-                        color: #888;
-                }
-            </style>
-        </head>
-        <body style='background: white;'>
-            <h1>TTP Validator</h1>
-            <h2>Issues Detected (%d)</h2>
-            <ol>
-    """ % (len(issues),))
+        fout.write(_HTML_HEAD % (len(issues),))
         # Output a list of errors found
         fout.write(generate_issue_list(issues, source))
-        fout.write(u"""
-            </ol>
-            <h2>Annotated Table Type Pattern %s</h2>
-            <pre>""" % (html_escape(args.ttp, False),))
+        fout.write(_HTML_MIDDLE % (html_escape(args.ttp, False),))
         # Output the JSON listing
         fout.write(generate_listing(issues, source))
-
-        fout.write(u"""
-            </pre>
-        </body>
-    </html>
-    """)
+        fout.write(_HTML_TAIL)
 
     print("Written to file:", args.output)
 
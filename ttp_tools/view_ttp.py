@@ -17,10 +17,11 @@
 # limitations under the License.
 
 from __future__ import print_function
-import argparse
+import sys
 import logging
+from itertools import chain
 
-from .TTP import TableTypePattern
+from six import StringIO
 
 # In python3 raw_input has been removed and renamed to input
 try:
@@ -40,6 +41,86 @@ MATCH_DOCS = """
 Match Suffix Key: !exact match, @prefix match, *optional, =value, /mask
 """
 
+# The options of the top level and identifiers menus
+MAIN_MENU = ("TTP Info", "Security", "Variables and Extension Identifiers",
+             "Tables", "Groups")
+IDENT_MENU = ("Variables", "Extension Identifiers")
+
+# The sections which can be printed non-interactively with --dump
+DUMP_SECTIONS = ("info", "security", "tables", "groups", "identifiers")
+
+USAGE = ("usage: view_ttp [-h] [-q] [--dump {" + ",".join(DUMP_SECTIONS) +
+         "}]\n                ttp")
+
+HELP = USAGE + """
+
+Command line tool for traversing the hierarchy of a TTP.
+
+positional arguments:
+  ttp                   A Table Type Pattern JSON description
+
+optional arguments:
+  -h, --help            show this help message and exit
+  -q, --quiet           Disable printing errors from parsing the TTP
+  --dump {""" + ",".join(DUMP_SECTIONS) + """}
+                        Print a section of the TTP and exit, rather than
+                        browsing interactively"""
+
+
+def _arg_error(message):
+    """ Print the usage and error message and exit, like argparse """
+    print(USAGE, file=sys.stderr)
+    print("view_ttp: error:", message, file=sys.stderr)
+    sys.exit(2)
+
+
+def parse_args(argv=None):
+    """ Parse command line arguments
+
+        This is hand-rolled as importing argparse takes longer than
+        parsing the few options of this tool.
+
+        argv: The arguments excluding the program name, defaults to sys.argv
+        Returns: A tuple (ttp path, quiet, dump section or None)
+    """
+    if argv is None:
+        argv = sys.argv[1:]
+    ttp = None
+    quiet = False
+    dump = None
+    positional_only = False
+    args = iter(argv)
+    for arg in args:
+        if positional_only or arg == '-' or not arg.startswith('-'):
+            if ttp is not None:
+                _arg_error("unrecognized arguments: " + arg)
+            ttp = arg
+        elif arg == '--':
+            positional_only = True
+        elif arg in ('-h', '--help'):
+            print(HELP)
+            sys.exit(0)
+        elif arg in ('-q', '--quiet'):
+            quiet = True
+        elif arg == '--dump' or arg.startswith('--dump='):
+            if arg == '--dump':
+                dump = next(args, None)
+                if dump is None:
+                    _arg_error("argument --dump: expected one argument")
+            else:
+                dump = arg[len('--dump='):]
+            if dump not in DUMP_SECTIONS:
+                _arg_error("argument --dump: invalid choice: '" + dump +
+                           "' (choose from " +
+                           ", ".join("'" + s + "'" for s in DUMP_SECTIONS) +
+                           ")")
+        else:
+            _arg_error("unrecognized arguments: " + arg)
+    if ttp is None:
+        _arg_error("the following arguments are required: ttp")
+    return ttp, quiet, dump
+
+
 def wait():
     """ Give the user a chance to read output """
     print("")
@@ -49,72 +130,77 @@ def wait():
 def select_options(options, text="Which one?", pre_numbered=False):
     """ Prompt the user to select from a number of options
 
-        Automatically adds the q, quit option to any list.
+        Automatically adds the q, quit option, options is not modified.
 
-        options: A list of choices
+        options: An iterable of choices
         text: The text displayed to the user
-        pre_numbered: If true, options should be a list of tuples
+        pre_numbered: If true, options should be an iterable of tuples
 
         Returns the option, otherwise
 
     """
     if not pre_numbered:
-        new_options = []
-        for idx, element in enumerate(options, 1):
-            new_options.append((idx, element))
-        options = new_options
-    options.append(('q', 'quit'))
+        options = enumerate(options, 1)
+    options = list(chain(options, (('q', 'quit'),)))
 
+    # Map the input to the option, ids take precedence over labels and
+    # earlier options over later
+    lookup = {}
+    lines = []
     for ele in options:
-        print("{}) {}".format(ele[0], ele[1]))
+        # Convert the id to a string once, for display and lookup
+        key = str(ele[0])
+        lines.append("{}) {}".format(key, ele[1]))
+        lookup.setdefault(key, ele)
+    # Print all options at once, rather than a write per option
+    print("\n".join(lines))
+    for ele in options:
+        lookup.setdefault(ele[1], ele)
     input_ = raw_input(text + " ")
     print("")
-    for item in options:
-        if str(item[0]) == input_:
-            return item
-    for item in options:
-        if item[1] == input_:
-            return item
-    return None
+    return lookup.get(input_)
 
 
 def menu_identifiers(ttp):
+    if ttp.identifiers:
+        variables = ttp.identifiers.variables
+        identifiers = ttp.identifiers.identifiers
+        # Number these once
+        variable_options = list(enumerate(variables.keys(), 1))
+        variable_options.append(('a', 'all'))
+        identifier_options = list(enumerate(identifiers.keys(), 1))
+        identifier_options.append(('a', 'all'))
     while True:
         if ttp.identifiers:
-            print("Found", len(ttp.identifiers.variables), "variables and",
-                  len(ttp.identifiers.identifiers), "identifiers")
-            options = ["Variables", "Extension Identifiers"]
-            var = select_options(options)
+            print("Found", len(variables), "variables and",
+                  len(identifiers), "identifiers")
+            var = select_options(IDENT_MENU)
             if var is None:
                 print("I didn't quite catch that")
                 continue
             elif var[0] == 'q':
                 return
             elif var[1] == "Variables":
-                options = list(enumerate(ttp.identifiers.variables.keys(), 1))
-                options.append(('a', 'all'))
-                var = select_options(options, pre_numbered=True)
+                var = select_options(variable_options, pre_numbered=True)
                 if var[0] == 'q':
                     continue
                 elif var[0] == 'a':
-                    for i in ttp.identifiers.variables.values():
+                    for i in variables.values():
                         print(i)
                         print('')
                 else:
-                    print(ttp.identifiers.variables[var[1]])
+                    print(variables[var[1]])
                 wait()
             elif var[1] == "Extension Identifiers":
-                options = list(enumerate(ttp.identifiers.identifiers.keys(), 1))
-                options.append(('a', 'all'))
-                var = select_options(options, pre_numbered=True)
+                var = select_options(identifier_options, pre_numbered=True)
                 if var[0] == 'q':
                     continue
                 elif var[0] == 'a':
-                    for i in ttp.identifiers.identifiers.values():
+                    for i in identifiers.values():
                         print(i)
                         print('')
                 else:
-                    print(ttp.identifiers.identifiers[var[1]])
+                    print(identifiers[var[1]])
                 wait()
         else:
             print("There seem to be no extra identifiers specified")
@@ -122,9 +208,11 @@ def menu_identifiers(ttp):
 
 
 def menu_tables(ttp):
+    # The TTP does not change, so only sort its tables once
+    ttp_tables = ttp.get_tables()
+    tables = [(t.number, t.name) for t in ttp_tables]
     while True:
-        print("Found ", len(ttp.get_tables()), "tables:")
-        tables = [(t.number, t.name) for t in ttp.get_tables()]
+        print("Found ", len(ttp_tables), "tables:")
         var = select_options(tables, "Which table?", True)
         if var is None:
             print("I didn't quite catch that")
@@ -135,24 +223,31 @@ def menu_tables(ttp):
             menu_flows(ttp.find_table(var[0]), ttp)
 
 def menu_flows(table, ttp):
+    flow_mod_types = table.flow_mod_types
+    built_in_flow_mods = table.built_in_flow_mods
+    flows = [(i, prefix + f.name, f) for i, (prefix, f) in enumerate(
+        chain((("", f) for f in flow_mod_types),
+              (("Built-in: ", f) for f in built_in_flow_mods)), 1)]
+    flows.append(('b', 'all built-in'))
+    flows.append(('a', 'all'))
     while True:
-        flows = [(i, f.name, f) for i, f in enumerate(table.flow_mod_types, 1)]
-        flows += [(i, "Built-in: " + f.name, f) for i, f in
-                  enumerate(table.built_in_flow_mods, len(flows) + 1)]
-        flows.append(('b', 'all built-in'))
-        flows.append(('a', 'all'))
-        print("Found ", len(table.flow_mod_types),
+        print("Found ", len(flow_mod_types),
               "flow mod types in", table.name + ":")
         var = select_options(flows, "Which flow?", True)
         if var is None:
             print("I didn't quite catch that")
             continue
         elif var[0] == 'a':
-            ttp.print_table(table)
+            # Collect a listing before printing, rather than a write per line
+            buf = StringIO()
+            ttp.print_table(table, file=buf)
+            print(buf.getvalue(), end="")
         elif var[0] == 'b':
-            for bifm in table.built_in_flow_mods:
-                print("")
-                bifm.print_flow()
+            buf = StringIO()
+            for bifm in built_in_flow_mods:
+                print("", file=buf)
+                bifm.print_flow(file=buf)
+            print(buf.getvalue(), end="")
         elif var[0] == 'q':
             return
         else:
@@ -162,9 +257,10 @@ def menu_flows(table, ttp):
 
 
 def menu_groups(ttp):
+    ttp_groups = ttp.get_groups()
+    groups = [g.name for g in ttp_groups]
     while True:
-        print("Found ", len(ttp.get_groups()), "groups:")
-        groups = [g.name for g in ttp.get_groups()]
+        print("Found ", len(ttp_groups), "groups:")
         var = select_options(groups, "Which group?")
         if var is None:
             print("I didn't quite catch that")
@@ -176,33 +272,64 @@ def menu_groups(ttp):
             wait()
 
 
-def main():
-    parser = argparse.ArgumentParser(
-        description='Command line tool for traversing the hierarchy of a TTP.')
-    parser.add_argument('ttp', help='A Table Type Pattern JSON description')
-    parser.add_argument('-q', '--quiet', action='store_true',
-                        help='Disable printing errors from parsing the TTP')
+def dump_section(ttp, section):
+    """ Print a section of the TTP, without any interaction
 
-    args = parser.parse_args()
+        ttp: The TableTypePattern
+        section: The section to print, one of DUMP_SECTIONS
+    """
+    if section == "info":
+        print(ttp.NDM_metadata)
+    elif section == "security":
+        if ttp.security:
+            print(ttp.security)
+        else:
+            print("No security guidance was provided by the TTP")
+    elif section == "tables":
+        for table in ttp.get_tables():
+            ttp.print_table(table)
+        print(MATCH_DOCS)
+    elif section == "groups":
+        for group in ttp.get_groups():
+            print(group)
+            print('')
+    elif section == "identifiers":
+        if ttp.identifiers:
+            for i in chain(ttp.identifiers.variables.values(),
+                           ttp.identifiers.identifiers.values()):
+                print(i)
+                print('')
+        else:
+            print("There seem to be no extra identifiers specified")
+
+
+def main():
+    ttp_path, quiet, dump = parse_args()
+    # Imported after parsing the arguments, so that -h and argument errors
+    # do not wait on loading the TTP and ofequivalence modules
+    from .TTP import TableTypePattern
 
     logger = None
-    if args.quiet:
+    if quiet:
         # Use a logger which logs nothing
         logger = logging.getLogger('dummy')
         logger.addHandler(logging.NullHandler())
         logger.propagate = False
 
+    # The original offsets are only used to locate errors when logging, when
+    # quiet skip tracking them which allows the faster C JSON decoder
+    ttp = TableTypePattern(ttp_path, track_orig=not quiet, logger=logger)
 
-    ttp = TableTypePattern(args.ttp, track_orig=True, logger=logger)
+    if dump is not None:
+        dump_section(ttp, dump)
+        return
 
     print("")
     print("Finished loading", ttp.NDM_metadata.get_short_description())
     print("")
 
     while True:
-        options = ["TTP Info", "Security", "Variables and Extension Identifiers",
-                   "Tables", "Groups"]
-        var = select_options(options)
+        var = select_options(MAIN_MENU)
         if var is None:
             print("I didn't quite catch that")
             continue